@@ -2,20 +2,30 @@
 import os
 import sqlite3
 import threading
+import asyncio
+import queue
+import contextlib
 import hmac
 import hashlib
 import json
-import datetime
+import time
 import pathlib
+import functools
+from typing import Optional
 from urllib.parse import parse_qsl
 
-from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form, Query
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query
+from fastapi.responses import HTMLResponse, ORJSONResponse
+from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
+import anyio
+import aiofiles
+import cachetools
+import httpx
 import logging
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo, Bot
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 
 logging.basicConfig(level=logging.INFO)
@@ -25,11 +35,14 @@ logger = logging.getLogger(__name__)
 BOT_TOKEN = os.getenv("BOT_TOKEN", "").strip()
 BOT_USERNAME = os.getenv("BOT_USERNAME", "X_Reward_Bot").strip()
 ADMINS_ENV = os.getenv("ADMIN_IDS", "")
-ADMIN_IDS = [int(x) for x in ADMINS_ENV.split(",") if x.strip().isdigit()] or []
+ADMIN_IDS = frozenset(int(x) for x in ADMINS_ENV.split(",") if x.strip().isdigit())
 WEBAPP_URL = os.getenv("WEBAPP_URL", "").rstrip("/")  # required for WebApp button to open nicely
 CHANNEL_LINK = os.getenv("CHANNEL_LINK", "https://t.me/X_Reward_botChannel")
 SUPPORT_LINK = os.getenv("SUPPORT_LINK", "https://t.me/xrewardchannel")
 PORT = int(os.getenv("PORT", "8080"))
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "100"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "10")) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 1 << 20
 
 # Persistent data location (Railway: mount persistent volume to /data)
 DATA_DIR = os.getenv("DATA_DIR", "/data")
@@ -43,72 +56,292 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 if not BOT_TOKEN:
     logger.warning("BOT_TOKEN not set. Bot will not start.")
 
-# Telegram Bot client (for membership checks). If token missing, this will be None.
-tg_bot = Bot(token=BOT_TOKEN) if BOT_TOKEN else None
+# Telegram Bot API base for direct calls (membership checks)
+TG_API = f"https://api.telegram.org/bot{BOT_TOKEN}"
 
 # ---------- DB ----------
-def get_db():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+DB_POOL_SIZE = max(2, int(os.getenv("DB_POOL_SIZE", "8")))
+DB_STATEMENT_CACHE = 256
+# seconds a request waits for a pooled connection before giving up with 503
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# One long-lived read-write connection (SQLite only allows a single writer anyway)
+# plus a pool of read-only connections. Keeping connections open preserves their
+# page cache between requests.
+_rw_pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+_ro_pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+_pool_lock = threading.Lock()
+_pool_ready = False
+
+def _connect(readonly: bool = False, busy_timeout_ms: int = 60000) -> sqlite3.Connection:
+    if readonly:
+        conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False, cached_statements=DB_STATEMENT_CACHE)
+    else:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=DB_STATEMENT_CACHE)
     conn.row_factory = sqlite3.Row
+    # per-connection tuning (journal_mode is persistent and set in migrate())
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
     return conn
 
-def migrate():
-    con = get_db(); cur = con.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users (
+def init_pool():
+    global _pool_ready
+    with _pool_lock:
+        if _pool_ready:
+            return
+        _rw_pool.put(_connect())
+        for _ in range(DB_POOL_SIZE - 1):
+            _ro_pool.put(_connect(readonly=True))
+        _pool_ready = True
+    logger.info("DB pool ready (1 rw + %d ro connections).", DB_POOL_SIZE - 1)
+
+@contextlib.contextmanager
+def _borrow(pool: "queue.Queue[sqlite3.Connection]"):
+    try:
+        conn = pool.get(timeout=DB_POOL_TIMEOUT)
+    except queue.Empty:
+        raise HTTPException(status_code=503, detail="database busy, retry shortly")
+    try:
+        yield conn
+    finally:
+        # never hand an open transaction to the next borrower
+        if conn.in_transaction:
+            conn.rollback()
+        pool.put(conn)
+
+def close_pool():
+    global _pool_ready
+    with _pool_lock:
+        if not _pool_ready:
+            return
+        with db_write() as conn:
+            conn.execute("PRAGMA optimize")
+        for pool in (_rw_pool, _ro_pool):
+            while not pool.empty():
+                pool.get_nowait().close()
+        _pool_ready = False
+
+def db_write():
+    return _borrow(_rw_pool)
+
+def db_read():
+    return _borrow(_ro_pool)
+
+SCHEMA = {
+    "users": """(
       user_id INTEGER PRIMARY KEY,
       username TEXT,
-      coins INTEGER DEFAULT 0,
+      coins INTEGER NOT NULL DEFAULT 0,
       referrer_id INTEGER,
       joined_at TEXT,
-      ads_watched INTEGER DEFAULT 0,
-      ad_counter INTEGER DEFAULT 0,
-      boost_until TEXT,
-      last_daily TEXT
-    )""")
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS tasks (
+      ads_watched INTEGER NOT NULL DEFAULT 0,
+      ad_counter INTEGER NOT NULL DEFAULT 0,
+      boost_until INTEGER,
+      last_daily INTEGER
+    )""",
+    "tasks": """(
       task_id INTEGER PRIMARY KEY AUTOINCREMENT,
       title TEXT,
       description TEXT,
       link TEXT,
       reward INTEGER
-    )""")
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS task_submissions (
+    )""",
+    "task_submissions": """(
       submission_id INTEGER PRIMARY KEY AUTOINCREMENT,
       user_id INTEGER,
       task_id INTEGER,
       file_path TEXT,
       status TEXT DEFAULT 'pending',
-      submitted_at TEXT,
+      submitted_at INTEGER,
       reviewed_by INTEGER,
       review_reason TEXT
-    )""")
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS verifiers (
+    )""",
+    "verifiers": """(
       verifier_id INTEGER PRIMARY KEY
-    )""")
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS referrals (
+    )""",
+    "referrals": """(
       referrer_id INTEGER,
       referred_id INTEGER,
       PRIMARY KEY (referrer_id, referred_id)
-    )""")
+    )""",
+}
+
+# timestamp columns that older databases stored as ISO text; they are now unix seconds
+UNIX_TS_COLUMNS = {"users": ("boost_until", "last_daily"), "task_submissions": ("submitted_at",)}
+# counters that older databases declared nullable; they are now NOT NULL DEFAULT 0
+NOT_NULL_COUNTERS = {"users": ("coins", "ads_watched", "ad_counter")}
+
+def _rebuild_table(cur, table: str, convert: dict):
+    # SQLite cannot change a column's type in place: copy into a table with the current schema
+    # in one transaction, so a crash midway leaves the old table untouched
+    cols = [r[1] for r in cur.execute(f"PRAGMA table_info({table})")]
+    exprs = ", ".join(convert.get(c, c) for c in cols)
+    cur.execute("BEGIN")
+    try:
+        cur.execute(f"DROP TABLE IF EXISTS {table}_new")
+        cur.execute(f"CREATE TABLE {table}_new {SCHEMA[table]}")
+        cur.execute(f"INSERT INTO {table}_new ({', '.join(cols)}) SELECT {exprs} FROM {table}")
+        cur.execute(f"DROP TABLE {table}")
+        cur.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        cur.execute("COMMIT")
+    except Exception:
+        cur.execute("ROLLBACK")
+        raise
+    logger.info("Rebuilt table %s.", table)
+
+def migrate():
+    # page_size can only change while not in WAL mode, so set it before switching journal mode
+    con = sqlite3.connect(DB_PATH, check_same_thread=False)
+    con.execute("PRAGMA page_size=4096")
+    con.execute("PRAGMA journal_mode=WAL")
+    cur = con.cursor()
+    for table in SCHEMA:
+        info = {r[1]: r for r in cur.execute(f"PRAGMA table_info({table})")}
+        convert = {}
+        for c in UNIX_TS_COLUMNS.get(table, ()):
+            if c in info and info[c][2].upper() == "TEXT":
+                convert[c] = f"CASE WHEN typeof({c}) = 'text' THEN CAST(strftime('%s', {c}) AS INTEGER) ELSE {c} END"
+        for c in NOT_NULL_COUNTERS.get(table, ()):
+            if c in info and not info[c][3]:
+                convert[c] = f"COALESCE({c}, 0)"
+        if convert:
+            _rebuild_table(cur, table, convert)
+    for table, cols in SCHEMA.items():
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {table} {cols}")
+    # indexes backing the leaderboard / submissions ordering
+    # leaderboard indexes cover every selected column (user_id is the keyset tie-breaker)
+    # so those queries never touch the users table; they replace the plain score indexes
+    cur.execute("DROP INDEX IF EXISTS idx_users_coins")
+    cur.execute("DROP INDEX IF EXISTS idx_users_ads")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_coins_cov ON users(coins DESC, user_id, username)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_ads_cov ON users(ads_watched DESC, user_id, username, coins)")
+    # submissions are listed by submission_id, so the submitted_at index only cost writes
+    cur.execute("DROP INDEX IF EXISTS idx_subs_submitted")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_subs_status ON task_submissions(status) WHERE status = 'pending'")
+    # referrer_id lookups are served by the (referrer_id, referred_id) primary key index
+    cur.execute("DROP INDEX IF EXISTS idx_ref_referrer")
+    con.commit()
+    cur.execute("ANALYZE")
     con.commit(); con.close()
     logger.info("DB migrated.")
 
+# Periodic housekeeping: keep the WAL file from growing without bound and the
+# planner statistics fresh. Runs on its own connection, outside the pool.
+MAINTENANCE_INTERVAL = int(os.getenv("MAINTENANCE_INTERVAL", "600"))
+ANALYZE_INTERVAL = 7 * 24 * 3600
+# short wait so a checkpoint/optimize never holds up request writers for long;
+# if it cannot get the locks in time it is simply retried on the next run
+MAINTENANCE_BUSY_TIMEOUT_MS = 1000
+
+def run_maintenance(analyze: bool = False) -> dict:
+    con = _connect(busy_timeout_ms=MAINTENANCE_BUSY_TIMEOUT_MS)
+    try:
+        busy, wal_frames, checkpointed = con.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        if analyze:
+            con.execute("ANALYZE")
+        con.execute("PRAGMA optimize")
+        con.commit()
+    finally:
+        con.close()
+    logger.info("DB maintenance done (analyze=%s, checkpoint busy=%s).", analyze, busy)
+    return {"checkpoint_busy": bool(busy), "wal_frames": wal_frames, "checkpointed": checkpointed, "analyzed": analyze}
+
+async def maintenance_loop():
+    last_analyze = time.monotonic()
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+        analyze = time.monotonic() - last_analyze >= ANALYZE_INTERVAL
+        try:
+            await asyncio.to_thread(run_maintenance, analyze)
+        except Exception as e:
+            logger.warning("DB maintenance error: %s", e)
+            continue
+        if analyze:
+            last_analyze = time.monotonic()
+
+# ---------- Verifier cache ----------
+# Verifiers change rarely, so authorization checks use an in-memory set that
+# add/remove_verifier keep current. It is re-read every VERIFIER_TTL seconds in
+# case another worker process changed the table.
+VERIFIER_TTL = 60
+_verifiers: set = set()
+_verifiers_loaded_at = float("-inf")
+# held across a reload's read+swap and across add/remove's commit+update, so a
+# stale snapshot can never overwrite a change (e.g. resurrect a revoked verifier)
+_verifiers_lock = threading.Lock()
+
+def load_verifiers(con: sqlite3.Connection):
+    global _verifiers, _verifiers_loaded_at
+    with _verifiers_lock:
+        _verifiers = {r[0] for r in con.execute("SELECT verifier_id FROM verifiers")}
+        _verifiers_loaded_at = time.monotonic()
+
+def is_reviewer(uid: int) -> bool:
+    if uid in ADMIN_IDS:
+        return True
+    if time.monotonic() - _verifiers_loaded_at > VERIFIER_TTL:
+        with db_read() as con:
+            load_verifiers(con)
+    return uid in _verifiers
+
+def _iso(ts: float) -> str:
+    # UTC timestamp (second precision) formatted by the C library instead of datetime
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ts))
+
+def _now_iso() -> str:
+    return _iso(time.time())
+
+# ---------- SQL ----------
+# Hot-path statements, gathered in one place. sqlite3 caches prepared statements by
+# their SQL text (up to cached_statements per connection), so literal queries hit
+# that cache anyway; the leaderboard variants are formatted here once instead of
+# with an f-string on every request.
+SQL_COUNT_TASKS = "SELECT COUNT(*) FROM tasks"
+SQL_TASKS_PAGE = "SELECT task_id, title, description, link, reward FROM tasks ORDER BY task_id DESC LIMIT ? OFFSET ?"
+SQL_TASKS_SEEK = "SELECT task_id, title, description, link, reward FROM tasks WHERE task_id < ? ORDER BY task_id DESC LIMIT ?"
+SQL_BALANCE = "SELECT coins, ads_watched, boost_until FROM users WHERE user_id = ?"
+SQL_AD_WATCHED = """
+    INSERT INTO users (user_id, username, coins, ads_watched, ad_counter) VALUES (:uid, :username, :coins, 1, 1)
+    ON CONFLICT(user_id) DO UPDATE SET
+      coins = coins + :coins,
+      ads_watched = ads_watched + 1,
+      ad_counter = CASE WHEN ad_counter + 1 >= 3 THEN 0 ELSE ad_counter + 1 END,
+      boost_until = CASE WHEN ad_counter + 1 >= 3 THEN :until ELSE boost_until END
+    RETURNING coins, ads_watched, ad_counter, boost_until"""
+SQL_COUNT_USERS = "SELECT COUNT(*) FROM users"
+SQL_COUNT_REFERRERS = "SELECT COUNT(DISTINCT referrer_id) FROM referrals"
+_LB_COINS = "SELECT username, coins, user_id FROM users {where} ORDER BY coins DESC, user_id LIMIT ? OFFSET ?"
+_LB_INVITES = "SELECT referrer_id, cnt, username, total FROM (SELECT r.referrer_id, COUNT(r.referred_id) AS cnt, u.username, COUNT(*) OVER () AS total FROM referrals r JOIN users u ON u.user_id = r.referrer_id GROUP BY r.referrer_id) {where} ORDER BY cnt DESC, referrer_id LIMIT ? OFFSET ?"
+_LB_ADS = "SELECT username, ads_watched, coins, user_id FROM users {where} ORDER BY ads_watched DESC, user_id LIMIT ? OFFSET ?"
+# submissions newest first; submission_id is monotonic, and the 'pending' literal
+# (rather than a bound parameter) lets the planner use the partial idx_subs_status
+SUBMISSION_STATUSES = ("pending", "approved", "rejected", "all")
+SQLITE_MAX_ROWID = 2**63 - 1
+_SUBS_COLS = "submission_id, user_id, task_id, file_path, status, submitted_at"
+SQL_SUBS_PENDING = f"SELECT {_SUBS_COLS} FROM task_submissions WHERE status = 'pending' AND submission_id < ? ORDER BY submission_id DESC LIMIT ? OFFSET ?"
+SQL_SUBS_BY_STATUS = f"SELECT {_SUBS_COLS} FROM task_submissions WHERE status = ? AND submission_id < ? ORDER BY submission_id DESC LIMIT ? OFFSET ?"
+SQL_SUBS_ALL = f"SELECT {_SUBS_COLS} FROM task_submissions WHERE submission_id < ? ORDER BY submission_id DESC LIMIT ? OFFSET ?"
+# (first page, cursor page) variants per leaderboard type
+SQL_LB_COINS = (_LB_COINS.format(where=""), _LB_COINS.format(where="WHERE coins <= ? AND (coins < ? OR user_id > ?)"))
+SQL_LB_INVITES = (_LB_INVITES.format(where=""), _LB_INVITES.format(where="WHERE cnt <= ? AND (cnt < ? OR referrer_id > ?)"))
+SQL_LB_ADS = (_LB_ADS.format(where=""), _LB_ADS.format(where="WHERE ads_watched <= ? AND (ads_watched < ? OR user_id > ?)"))
+
 # ---------- Telegram WebApp init_data verification ----------
-def verify_init_data(init_data: str, bot_token: str) -> dict:
+# the bot token never changes, so derive the HMAC key once
+SECRET_KEY = hashlib.sha256(BOT_TOKEN.encode()).digest()
+
+def verify_init_data(init_data: str) -> dict:
     parsed = dict(parse_qsl(init_data, strict_parsing=True))
     if 'hash' not in parsed:
         raise ValueError("Missing hash")
     check_hash = parsed.pop('hash')
-    data_check_list = [f"{k}={parsed[k]}" for k in sorted(parsed.keys())]
-    data_check_string = "\n".join(data_check_list)
-    secret_key = hashlib.sha256(bot_token.encode()).digest()
-    calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
-    if calculated_hash != check_hash:
+    data_check_string = b"\n".join(f"{k}={v}".encode() for k, v in sorted(parsed.items()))
+    # one-shot C implementation; avoids building an HMAC object per request
+    calculated_hash = hmac.digest(SECRET_KEY, data_check_string, "sha256").hex()
+    if not hmac.compare_digest(calculated_hash, check_hash):
         raise ValueError("Invalid hash")
     if 'user' in parsed:
         try:
@@ -121,39 +354,116 @@ def verify_init_data(init_data: str, bot_token: str) -> dict:
 def extract_channel_username(link: str) -> str:
     return link.rstrip('/').split('/')[-1]
 
-def is_member_of_channel(user_id: int) -> bool:
-    if not tg_bot:
-        return False
+def channel_chat_id() -> str:
     channel = extract_channel_username(CHANNEL_LINK)
     if not channel:
-        return False
+        return ""
     # ensure an @ prefix
-    chat_id = channel if channel.startswith('@') else f"@{channel}"
+    return channel if channel.startswith('@') else f"@{channel}"
+
+# membership lookups hit the Telegram API; remember positives for longer than negatives
+# so a user who just joined is not locked out for long
+_member_yes = cachetools.TTLCache(maxsize=100000, ttl=300)
+_member_no = cachetools.TTLCache(maxsize=100000, ttl=30)
+
+# One keep-alive HTTP client per event loop (the bot polls in its own thread and loop),
+# so repeated membership checks reuse the TCP/TLS connection to api.telegram.org.
+_tg_clients: dict = {}
+
+def tg_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _tg_clients.get(loop)
+    if client is None:
+        client = _tg_clients[loop] = httpx.AsyncClient(http2=True, timeout=10, limits=httpx.Limits(max_keepalive_connections=20))
+    return client
+
+async def close_tg_client():
+    client = _tg_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+async def is_member_of_channel(user_id: int, fresh: bool = False) -> bool:
+    # fresh=True is for explicit "I joined" checks: skip a cached negative so a
+    # user who joined after being prompted is seen right away
+    if not BOT_TOKEN:
+        return False
+    if fresh:
+        _member_no.pop(user_id, None)
+    if user_id in _member_yes:
+        return True
+    if user_id in _member_no:
+        return False
+    chat_id = channel_chat_id()
+    if not chat_id:
+        return False
     try:
-        member = tg_bot.get_chat_member(chat_id=chat_id, user_id=user_id)
-        return member.status in ("member", "administrator", "creator")
+        resp = await tg_client().post(f"{TG_API}/getChatMember", json={"chat_id": chat_id, "user_id": user_id})
+        body = resp.json()
     except Exception as e:
         logger.debug("Channel membership check error: %s", e)
         return False
+    if not body.get("ok"):
+        # e.g. "user not found" for users who never joined
+        logger.debug("Channel membership check error: %s", body.get("description"))
+    is_member = bool(body.get("ok")) and body["result"].get("status") in ("member", "administrator", "creator")
+    if is_member:
+        _member_yes[user_id] = True
+    else:
+        _member_no[user_id] = True
+    return is_member
 
 # ---------- FastAPI app ----------
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+# Reject oversized proof uploads from Content-Length before the multipart body is
+# received and spooled; submit_proof still counts bytes for chunked uploads.
+# Plain ASGI so every other request passes straight through.
+class UploadSizeLimit:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/webapp/submit_proof":
+            content_length = dict(scope["headers"]).get(b"content-length", b"")
+            if content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+                response = ORJSONResponse({"detail": "file too large"}, status_code=413)
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+# added first so CORS wraps it and the 413 still carries CORS headers
+app.add_middleware(UploadSizeLimit)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
-# Serve index.html
+@app.on_event("startup")
+async def on_startup():
+    # plain `def` endpoints run in anyio's threadpool; the default 40 threads is easy to exhaust
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    init_pool()
+    with db_read() as con:
+        load_verifiers(con)
+    index_html()
+    app.state.maintenance = asyncio.create_task(maintenance_loop())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    app.state.maintenance.cancel()
+    await close_tg_client()
+    close_pool()
+
+# Serve index.html (static, so read it once)
+@functools.lru_cache(maxsize=1)
+def index_html() -> bytes:
+    if os.path.exists("index.html"):
+        with open("index.html", "rb") as f:
+            return f.read()
+    return b"<h3>Upload index.html to project root.</h3>"
+
 @app.get("/", response_class=HTMLResponse)
 async def index():
-    if os.path.exists("index.html"):
-        return HTMLResponse(open("index.html", "r", encoding="utf-8").read())
-    return HTMLResponse("<h3>Upload index.html to project root.</h3>")
+    return HTMLResponse(index_html())
 
 # Serve uploaded files
-@app.get("/uploads/{fname}")
-async def serve_upload(fname: str):
-    safe = os.path.join(UPLOAD_DIR, os.path.basename(fname))
-    if not os.path.exists(safe):
-        raise HTTPException(status_code=404, detail="Not found")
-    return FileResponse(safe)
+app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 
 # Check join endpoint
 @app.post("/webapp/check_join")
@@ -162,301 +472,393 @@ async def webapp_check_join(payload: dict):
     if not init_data:
         raise HTTPException(status_code=400, detail="init_data required")
     try:
-        parsed = verify_init_data(init_data, BOT_TOKEN)
+        parsed = verify_init_data(init_data)
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
     user = parsed.get("user", {}); uid = int(user.get("id"))
-    member = is_member_of_channel(uid)
+    member = await is_member_of_channel(uid, fresh=True)
     return {"ok": True, "member": member, "channel": CHANNEL_LINK}
 
-# Get tasks with pagination
+# Get tasks with keyset pagination (`page` is deprecated, kept for old clients)
 @app.get("/webapp/get_tasks")
-async def get_tasks(page: int = Query(1, ge=1), per_page: int = Query(10, ge=1, le=50)):
-    con = get_db(); cur = con.cursor()
-    cur.execute("SELECT COUNT(*) FROM tasks")
-    total = cur.fetchone()[0]
-    offset = (page - 1) * per_page
-    cur.execute("SELECT task_id, title, description, link, reward FROM tasks ORDER BY task_id DESC LIMIT ? OFFSET ?", (per_page, offset))
-    rows = cur.fetchall(); con.close()
-    tasks = [{"task_id": r[0], "title": r[1], "description": r[2], "link": r[3], "reward": r[4]} for r in rows]
-    return {"ok": True, "tasks": tasks, "page": page, "per_page": per_page, "total": total}
+def get_tasks(cursor: Optional[int] = Query(None, ge=1), page: int = Query(1, ge=1), per_page: int = Query(10, ge=1, le=50)):
+    with db_read() as con:
+        cur = con.cursor()
+        cur.execute(SQL_COUNT_TASKS)
+        total = cur.fetchone()[0]
+        if cursor is not None:
+            cur.execute(SQL_TASKS_SEEK, (cursor, per_page))
+        else:
+            offset = (page - 1) * per_page
+            cur.execute(SQL_TASKS_PAGE, (per_page, offset))
+        rows = cur.fetchall()
+        tasks = [{"task_id": r[0], "title": r[1], "description": r[2], "link": r[3], "reward": r[4]} for r in rows]
+        next_cursor = rows[-1][0] if len(rows) == per_page else None
+        # payload is already plain JSON types; returning the response directly skips jsonable_encoder
+        return ORJSONResponse({"ok": True, "tasks": tasks, "page": page, "per_page": per_page, "total": total, "next_cursor": next_cursor})
 
 # User balance endpoint
 @app.get("/balance/{user_id}")
-async def balance(user_id: int):
-    con = get_db(); cur = con.cursor()
-    cur.execute("SELECT COALESCE(coins,0), COALESCE(ads_watched,0), boost_until FROM users WHERE user_id = ?", (user_id,))
-    row = cur.fetchone(); con.close()
-    if not row:
-        return {"ok": True, "coins": 0, "ads_watched": 0, "boost_active": False}
-    coins, ads_watched, boost_until = row
-    boost_active = False
-    if boost_until:
-        try:
-            until = datetime.datetime.fromisoformat(boost_until.replace("Z", ""))
-            boost_active = until > datetime.datetime.utcnow()
-        except:
-            boost_active = False
-    return {"ok": True, "coins": coins, "ads_watched": ads_watched, "boost_active": boost_active}
+def balance(user_id: int):
+    with db_read() as con:
+        cur = con.cursor()
+        cur.execute(SQL_BALANCE, (user_id,))
+        row = cur.fetchone()
+        if not row:
+            return {"ok": True, "coins": 0, "ads_watched": 0, "boost_active": False}
+        coins, ads_watched, boost_until = row
+        boost_active = (boost_until or 0) > time.time()
+        return {"ok": True, "coins": coins, "ads_watched": ads_watched, "boost_active": boost_active}
 
 # Ad watched endpoint
 @app.post("/webapp/ad_watched")
-async def ad_watched(req: Request):
-    payload = await req.json()
+async def ad_watched(payload: dict):
     init_data = payload.get("init_data", "")
     if not init_data:
         raise HTTPException(status_code=400, detail="init_data required")
     try:
-        parsed = verify_init_data(init_data, BOT_TOKEN)
+        parsed = verify_init_data(init_data)
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
     user = parsed.get("user", {}); uid = int(user.get("id"))
     # require channel membership
-    if not is_member_of_channel(uid):
-        return JSONResponse({"ok": False, "error": "join_channel", "channel": CHANNEL_LINK})
+    if not await is_member_of_channel(uid):
+        return ORJSONResponse({"ok": False, "error": "join_channel", "channel": CHANNEL_LINK})
     username = user.get("username") or user.get("first_name") or f"user{uid}"
-    con = get_db(); cur = con.cursor()
-    cur.execute("INSERT OR IGNORE INTO users (user_id, username, coins, ads_watched, ad_counter) VALUES (?, ?, 0, 0, 0)", (uid, username))
     coins_awarded = 100
-    cur.execute("UPDATE users SET coins = COALESCE(coins,0) + ?, ads_watched = COALESCE(ads_watched,0) + 1 WHERE user_id = ?", (coins_awarded, uid))
-    cur.execute("SELECT COALESCE(ad_counter,0) FROM users WHERE user_id = ?", (uid,))
-    row = cur.fetchone()
-    ad_counter = (row[0] or 0) + 1
-    boost_activated = None
-    if ad_counter >= 3:
-        until = (datetime.datetime.utcnow() + datetime.timedelta(hours=2)).isoformat() + "Z"
-        cur.execute("UPDATE users SET boost_until = ?, ad_counter = 0 WHERE user_id = ?", (until, uid))
-        boost_activated = until
-        ads_to_next = 3
-    else:
-        cur.execute("UPDATE users SET ad_counter = ? WHERE user_id = ?", (ad_counter, uid))
-        ads_to_next = 3 - ad_counter
-    con.commit()
-    cur.execute("SELECT coins, ads_watched FROM users WHERE user_id = ?", (uid,))
-    coins, ads_watched = cur.fetchone()
-    con.close()
+    # the writer is only borrowed here, not across the Telegram call above
+    def award():
+        until = int(time.time()) + 2 * 3600
+        # one atomic upsert: award coins, bump the ad counter and start Power Mode every 3rd ad
+        with db_write() as con, con:
+            coins, ads_watched, ad_counter, boost_until = con.execute(SQL_AD_WATCHED, {"uid": uid, "username": username, "coins": coins_awarded, "until": until}).fetchall()[0]
+        if ad_counter == 0:
+            return coins, ads_watched, 3, _iso(boost_until) + "Z"
+        return coins, ads_watched, 3 - ad_counter, None
+    coins, ads_watched, ads_to_next, boost_activated = await asyncio.to_thread(award)
     return {"ok": True, "coins_awarded": coins_awarded, "coins_total": coins, "ads_watched": ads_watched, "ads_to_next_boost": ads_to_next, "boost_until": boost_activated}
 
 # Submit proof (image file)
 @app.post("/webapp/submit_proof")
 async def submit_proof(init_data: str = Form(...), task_id: int = Form(...), file: UploadFile = File(...)):
     try:
-        parsed = verify_init_data(init_data, BOT_TOKEN)
+        parsed = verify_init_data(init_data)
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
     user = parsed.get("user", {}); uid = int(user.get("id"))
-    if not is_member_of_channel(uid):
+    if not await is_member_of_channel(uid):
         raise HTTPException(status_code=403, detail="join_channel")
-    ts = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
-    ext = pathlib.Path(file.filename).suffix or ".jpg"
+    ts = time.strftime("%Y%m%d%H%M%S", time.gmtime())
+    # only keep a plain alphanumeric extension from the client-supplied name
+    ext = pathlib.Path(pathlib.Path(file.filename or "").name).suffix.lower()
+    if not ext[1:].isalnum():
+        ext = ".jpg"
     fname = f"{uid}_{ts}{ext}"
     fpath = os.path.join(UPLOAD_DIR, fname)
-    content = await file.read()
-    with open(fpath, "wb") as f:
-        f.write(content)
-    con = get_db(); cur = con.cursor()
-    cur.execute("INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)", (uid, user.get("username") or user.get("first_name") or f"user{uid}"))
-    cur.execute("INSERT INTO task_submissions (user_id, task_id, file_path, submitted_at) VALUES (?, ?, ?, ?)", (uid, task_id, fpath, datetime.datetime.utcnow().isoformat()))
-    con.commit(); con.close()
+    # stream to disk in chunks so memory stays flat regardless of upload size
+    written = 0
+    async with aiofiles.open(fpath, "wb") as out:
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            written += len(chunk)
+            if written > MAX_UPLOAD_BYTES:
+                break
+            await out.write(chunk)
+    if written > MAX_UPLOAD_BYTES:
+        await asyncio.to_thread(os.remove, fpath)
+        raise HTTPException(status_code=413, detail="file too large")
+    def record():
+        with db_write() as con:
+            cur = con.cursor()
+            cur.execute("INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)", (uid, user.get("username") or user.get("first_name") or f"user{uid}"))
+            cur.execute("INSERT INTO task_submissions (user_id, task_id, file_path, submitted_at) VALUES (?, ?, ?, ?)", (uid, task_id, fpath, int(time.time())))
+            con.commit()
+    # keep sqlite off the event loop; this endpoint stays async for the upload
+    await asyncio.to_thread(record)
     return {"ok": True, "msg": "Proof submitted (image). Waiting for review."}
 
-# Get pending submissions (admin/verifier)
+# Get submissions (admin/verifier), newest first; defaults to the pending queue.
+# Pages by submission_id cursor, or by `page` offset when no cursor is given.
 @app.post("/webapp/submissions")
-async def get_submissions(payload: dict):
-    init_data = payload.get("init_data", "")
+def get_submissions(payload: dict):
+    init_data = payload.get("init_data", ""); status = payload.get("status", "pending"); cursor = payload.get("cursor")
     if not init_data:
         raise HTTPException(status_code=400, detail="init_data required")
+    if status not in SUBMISSION_STATUSES:
+        raise HTTPException(status_code=400, detail="status must be one of: " + ", ".join(SUBMISSION_STATUSES))
+    try:
+        page = max(1, int(payload.get("page", 1))); per_page = min(100, max(1, int(payload.get("per_page", 50))))
+        cursor = int(cursor) if cursor is not None else None
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="page, per_page and cursor must be integers")
     try:
-        parsed = verify_init_data(init_data, BOT_TOKEN)
+        parsed = verify_init_data(init_data)
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
     uid = int(parsed.get("user", {}).get("id"))
-    con = get_db(); cur = con.cursor()
-    cur.execute("SELECT verifier_id FROM verifiers")
-    ver_rows = [r[0] for r in cur.fetchall()]
-    if uid not in ADMIN_IDS and uid not in ver_rows:
-        con.close(); raise HTTPException(status_code=403, detail="Not authorized")
-    cur.execute("SELECT submission_id, user_id, task_id, file_path, status, submitted_at FROM task_submissions ORDER BY submitted_at DESC")
-    rows = cur.fetchall(); con.close()
+    if not is_reviewer(uid):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    before = cursor if cursor is not None else SQLITE_MAX_ROWID
+    offset = 0 if cursor is not None else (page - 1) * per_page
+    with db_read() as con:
+        if status == "pending":
+            rows = con.execute(SQL_SUBS_PENDING, (before, per_page, offset)).fetchall()
+        elif status == "all":
+            rows = con.execute(SQL_SUBS_ALL, (before, per_page, offset)).fetchall()
+        else:
+            rows = con.execute(SQL_SUBS_BY_STATUS, (status, before, per_page, offset)).fetchall()
     subs = []
     for r in rows:
         file_url = f"/uploads/{os.path.basename(r['file_path'])}" if r['file_path'] else ""
-        subs.append({"submission_id": r["submission_id"], "user_id": r["user_id"], "task_id": r["task_id"], "file_path": file_url, "status": r["status"], "submitted_at": r["submitted_at"]})
-    return {"ok": True, "submissions": subs}
+        subs.append({"submission_id": r["submission_id"], "user_id": r["user_id"], "task_id": r["task_id"], "file_path": file_url, "status": r["status"], "submitted_at": _iso(r["submitted_at"]) if r["submitted_at"] is not None else None})
+    next_cursor = rows[-1]["submission_id"] if len(rows) == per_page else None
+    return {"ok": True, "submissions": subs, "status": status, "page": page, "per_page": per_page, "next_cursor": next_cursor}
 
 # Review submission
 @app.post("/webapp/review_submission")
-async def review_submission(payload: dict):
+def review_submission(payload: dict):
     init_data = payload.get("init_data", ""); sub_id = payload.get("submission_id"); action = payload.get("action"); reason = payload.get("reason", "")
     if not init_data or not sub_id or action not in ("approve", "reject"):
         raise HTTPException(status_code=400, detail="init_data, submission_id and valid action required")
     try:
-        parsed = verify_init_data(init_data, BOT_TOKEN)
+        parsed = verify_init_data(init_data)
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
     uid = int(parsed.get("user", {}).get("id"))
-    con = get_db(); cur = con.cursor()
-    cur.execute("SELECT verifier_id FROM verifiers"); ver_rows = [r[0] for r in cur.fetchall()]
-    if uid not in ADMIN_IDS and uid not in ver_rows:
-        con.close(); raise HTTPException(status_code=403, detail="Not authorized")
-    cur.execute("SELECT user_id, task_id, status FROM task_submissions WHERE submission_id = ?", (sub_id,))
-    row = cur.fetchone()
-    if not row:
-        con.close(); raise HTTPException(status_code=404, detail="Not found")
-    target_uid, task_id, status_now = row[0], row[1], row[2]
-    if status_now != "pending":
-        con.close(); return {"ok": False, "error": "already reviewed"}
-    if action == "approve":
-        cur.execute("SELECT reward FROM tasks WHERE task_id = ?", (task_id,))
-        r = cur.fetchone(); reward = r[0] if r else 0
-        cur.execute("SELECT boost_until FROM users WHERE user_id = ?", (target_uid,))
-        brow = cur.fetchone()
-        if_b = False
-        if brow and brow[0]:
-            try:
-                until = datetime.datetime.fromisoformat(brow[0].replace("Z", ""))
-                if until > datetime.datetime.utcnow():
-                    if_b = True
-            except:
-                if_b = False
-        if if_b:
-            reward = reward * 2
-        cur.execute("UPDATE users SET coins = COALESCE(coins,0) + ? WHERE user_id = ?", (reward, target_uid))
-        cur.execute("UPDATE task_submissions SET status = 'approved', reviewed_by = ?, review_reason = ? WHERE submission_id = ?", (uid, reason, sub_id))
-        con.commit(); con.close()
-        return {"ok": True, "awarded": reward}
-    else:
-        cur.execute("UPDATE task_submissions SET status = 'rejected', reviewed_by = ?, review_reason = ? WHERE submission_id = ?", (uid, reason, sub_id))
-        con.commit(); con.close()
-        return {"ok": True, "msg": "Rejected"}
+    if not is_reviewer(uid):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    # borrow the single writer only once the request is validated and authorized
+    with db_write() as con:
+        cur = con.cursor()
+        cur.execute("SELECT user_id, task_id, status FROM task_submissions WHERE submission_id = ?", (sub_id,))
+        row = cur.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Not found")
+        target_uid, task_id, status_now = row[0], row[1], row[2]
+        if status_now != "pending":
+            return {"ok": False, "error": "already reviewed"}
+        if action == "approve":
+            cur.execute("SELECT reward FROM tasks WHERE task_id = ?", (task_id,))
+            r = cur.fetchone(); reward = r[0] if r else 0
+            cur.execute("SELECT 1 FROM users WHERE user_id = ? AND boost_until > ?", (target_uid, int(time.time())))
+            if cur.fetchone():
+                reward = reward * 2
+            cur.execute("UPDATE users SET coins = coins + ? WHERE user_id = ?", (reward, target_uid))
+            cur.execute("UPDATE task_submissions SET status = 'approved', reviewed_by = ?, review_reason = ? WHERE submission_id = ?", (uid, reason, sub_id))
+            con.commit()
+            return {"ok": True, "awarded": reward}
+        else:
+            cur.execute("UPDATE task_submissions SET status = 'rejected', reviewed_by = ?, review_reason = ? WHERE submission_id = ?", (uid, reason, sub_id))
+            con.commit()
+            return {"ok": True, "msg": "Rejected"}
 
 # Admin: add / delete tasks
 @app.post("/webapp/add_task")
-async def add_task(payload: dict):
+def add_task(payload: dict):
     init_data = payload.get("init_data", ""); title = payload.get("title","").strip(); description = payload.get("description","").strip(); link = payload.get("link","").strip(); reward = int(payload.get("reward",0))
     if not init_data or not title or reward <= 0:
         raise HTTPException(status_code=400, detail="init_data, title and positive reward required")
-    try: parsed = verify_init_data(init_data, BOT_TOKEN)
+    try: parsed = verify_init_data(init_data)
     except Exception as e: raise HTTPException(status_code=401, detail=str(e))
     uid = int(parsed.get("user", {}).get("id"))
     if uid not in ADMIN_IDS:
         raise HTTPException(status_code=403, detail="Not authorized")
-    con = get_db(); cur = con.cursor()
-    cur.execute("INSERT INTO tasks (title, description, link, reward) VALUES (?, ?, ?, ?)", (title, description, link, reward))
-    con.commit(); con.close()
-    return {"ok": True}
+    # borrow the single writer only once the request is validated and authorized
+    with db_write() as con:
+        cur = con.cursor()
+        cur.execute("INSERT INTO tasks (title, description, link, reward) VALUES (?, ?, ?, ?)", (title, description, link, reward))
+        con.commit()
+        return {"ok": True}
 
 @app.post("/webapp/delete_task")
-async def delete_task(payload: dict):
+def delete_task(payload: dict):
     init_data = payload.get("init_data", ""); task_id = payload.get("task_id")
     if not init_data or not task_id:
         raise HTTPException(status_code=400, detail="init_data and task_id required")
-    try: parsed = verify_init_data(init_data, BOT_TOKEN)
+    try: parsed = verify_init_data(init_data)
     except Exception as e: raise HTTPException(status_code=401, detail=str(e))
     uid = int(parsed.get("user", {}).get("id"))
     if uid not in ADMIN_IDS:
         raise HTTPException(status_code=403, detail="Not authorized")
-    con = get_db(); cur = con.cursor()
-    cur.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
-    con.commit(); con.close()
-    return {"ok": True}
+    # borrow the single writer only once the request is validated and authorized
+    with db_write() as con:
+        cur = con.cursor()
+        cur.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+        con.commit()
+        return {"ok": True}
 
 # Verifier management
 @app.post("/webapp/add_verifier")
-async def add_verifier(payload: dict):
+def add_verifier(payload: dict):
     init_data = payload.get("init_data", ""); vid = payload.get("verifier_id")
-    if not init_data or not vid:
+    if not init_data or not str(vid or "").isdigit():
         raise HTTPException(status_code=400, detail="init_data and verifier_id required")
-    try: parsed = verify_init_data(init_data, BOT_TOKEN)
+    vid = int(vid)
+    try: parsed = verify_init_data(init_data)
     except Exception as e: raise HTTPException(status_code=401, detail=str(e))
     uid = int(parsed.get("user", {}).get("id"))
     if uid not in ADMIN_IDS:
         raise HTTPException(status_code=403, detail="Not authorized")
-    con = get_db(); cur = con.cursor()
-    cur.execute("INSERT OR IGNORE INTO verifiers (verifier_id) VALUES (?)", (vid,))
-    con.commit(); con.close()
-    return {"ok": True}
+    # borrow the single writer only once the request is validated and authorized
+    with _verifiers_lock, db_write() as con:
+        cur = con.cursor()
+        cur.execute("INSERT OR IGNORE INTO verifiers (verifier_id) VALUES (?)", (vid,))
+        con.commit()
+        _verifiers.add(vid)
+        return {"ok": True}
 
 @app.post("/webapp/remove_verifier")
-async def remove_verifier(payload: dict):
+def remove_verifier(payload: dict):
     init_data = payload.get("init_data", ""); vid = payload.get("verifier_id")
-    if not init_data or not vid:
+    if not init_data or not str(vid or "").isdigit():
         raise HTTPException(status_code=400, detail="init_data and verifier_id required")
-    try: parsed = verify_init_data(init_data, BOT_TOKEN)
+    vid = int(vid)
+    try: parsed = verify_init_data(init_data)
     except Exception as e: raise HTTPException(status_code=401, detail=str(e))
     uid = int(parsed.get("user", {}).get("id"))
     if uid not in ADMIN_IDS:
         raise HTTPException(status_code=403, detail="Not authorized")
-    con = get_db(); cur = con.cursor()
-    cur.execute("DELETE FROM verifiers WHERE verifier_id = ?", (vid,))
-    con.commit(); con.close()
-    return {"ok": True}
+    # borrow the single writer only once the request is validated and authorized
+    with _verifiers_lock, db_write() as con:
+        cur = con.cursor()
+        cur.execute("DELETE FROM verifiers WHERE verifier_id = ?", (vid,))
+        con.commit()
+        _verifiers.discard(vid)
+        return {"ok": True}
+
+# Admin: manual DB maintenance (checkpoint + optimize, optionally ANALYZE)
+@app.post("/admin/maintenance")
+def admin_maintenance(payload: dict):
+    init_data = payload.get("init_data", ""); analyze = bool(payload.get("analyze", False))
+    if not init_data:
+        raise HTTPException(status_code=400, detail="init_data required")
+    try: parsed = verify_init_data(init_data)
+    except Exception as e: raise HTTPException(status_code=401, detail=str(e))
+    uid = int(parsed.get("user", {}).get("id"))
+    if uid not in ADMIN_IDS:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    try:
+        return {"ok": True, **run_maintenance(analyze)}
+    except sqlite3.OperationalError as e:
+        # the maintenance connection gives up quickly instead of stalling writers
+        raise HTTPException(status_code=503, detail=f"maintenance skipped: {e}")
+
+def parse_cursor(cursor: str) -> tuple:
+    # leaderboard cursors are "<score>:<user_id>" of the last row seen; rows are
+    # ordered by score DESC then user_id ASC to match the covering score indexes
+    try:
+        score, user_id = cursor.split(":", 1)
+        return int(score), int(user_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
 
-# Leaderboards with pagination
+# Leaderboards with keyset pagination (`page` is deprecated, kept for old clients)
 @app.get("/webapp/leaderboards")
-async def leaderboards(type: str = Query("coins"), page: int = Query(1, ge=1), per_page: int = Query(10, ge=1, le=50)):
-    con = get_db(); cur = con.cursor()
-    offset = (page - 1) * per_page
-    if type == "coins":
-        cur.execute("SELECT COUNT(*) FROM users"); total = cur.fetchone()[0]
-        cur.execute("SELECT username, coins FROM users ORDER BY coins DESC LIMIT ? OFFSET ?", (per_page, offset))
-        rows = cur.fetchall()
-        items = [{"username": r[0], "coins": r[1]} for r in rows]
-    elif type == "invites":
-        # count referrals per referrer
-        cur.execute("SELECT COUNT(DISTINCT referrer_id) FROM referrals"); total = 0
-        cur.execute("SELECT r.referrer_id, COUNT(r.referred_id) as cnt, u.username FROM referrals r JOIN users u ON u.user_id = r.referrer_id GROUP BY r.referrer_id ORDER BY cnt DESC LIMIT ? OFFSET ?", (per_page, offset))
-        rows = cur.fetchall()
-        items = [{"user_id": r[0], "username": r[2] or "Unknown", "invites": r[1]} for r in rows]
-        cur.execute("SELECT COUNT(DISTINCT referrer_id) FROM referrals"); total = cur.fetchone()[0] or 0
-    else:  # ads
-        cur.execute("SELECT COUNT(*) FROM users"); total = cur.fetchone()[0]
-        cur.execute("SELECT username, ads_watched, coins FROM users ORDER BY ads_watched DESC LIMIT ? OFFSET ?", (per_page, offset))
-        rows = cur.fetchall()
-        items = [{"username": r[0], "ads": r[1], "coins": r[2]} for r in rows]
-    con.close()
-    return {"ok": True, "items": items, "page": page, "per_page": per_page, "total": total}
+def leaderboards(type: str = Query("coins"), cursor: Optional[str] = Query(None), page: int = Query(1, ge=1), per_page: int = Query(10, ge=1, le=50)):
+    if cursor is not None:
+        score, last_id = parse_cursor(cursor)
+        seek = (score, score, last_id); offset = 0
+    else:
+        seek = (); offset = (page - 1) * per_page
+    with db_read() as con:
+        cur = con.cursor()
+        if type == "coins":
+            cur.execute(SQL_COUNT_USERS); total = cur.fetchone()[0]
+            cur.execute(SQL_LB_COINS[bool(seek)], (*seek, per_page, offset))
+            rows = cur.fetchall()
+            items = [{"username": r[0], "coins": r[1]} for r in rows]
+            next_cursor = f"{rows[-1][1]}:{rows[-1][2]}" if len(rows) == per_page else None
+        elif type == "invites":
+            # count referrals per referrer; the window total is computed over all groups before the page is cut
+            cur.execute(SQL_LB_INVITES[bool(seek)], (*seek, per_page, offset))
+            rows = cur.fetchall()
+            items = [{"user_id": r[0], "username": r[2] or "Unknown", "invites": r[1]} for r in rows]
+            next_cursor = f"{rows[-1][1]}:{rows[-1][0]}" if len(rows) == per_page else None
+            if rows:
+                total = rows[0][3]
+            else:  # past the last page, nothing to read the total from
+                cur.execute(SQL_COUNT_REFERRERS); total = cur.fetchone()[0] or 0
+        else:  # ads
+            cur.execute(SQL_COUNT_USERS); total = cur.fetchone()[0]
+            cur.execute(SQL_LB_ADS[bool(seek)], (*seek, per_page, offset))
+            rows = cur.fetchall()
+            items = [{"username": r[0], "ads": r[1], "coins": r[2]} for r in rows]
+            next_cursor = f"{rows[-1][1]}:{rows[-1][3]}" if len(rows) == per_page else None
+        return ORJSONResponse({"ok": True, "items": items, "page": page, "per_page": per_page, "total": total, "next_cursor": next_cursor})
 
 # Daily claim endpoint
 @app.post("/webapp/daily_claim")
-async def daily_claim(payload: dict):
+def daily_claim(payload: dict):
     init_data = payload.get("init_data", "")
     if not init_data:
         raise HTTPException(status_code=400, detail="init_data required")
-    try: parsed = verify_init_data(init_data, BOT_TOKEN)
+    try: parsed = verify_init_data(init_data)
     except Exception as e: raise HTTPException(status_code=401, detail=str(e))
     uid = int(parsed.get("user", {}).get("id"))
-    con = get_db(); cur = con.cursor()
-    cur.execute("INSERT OR IGNORE INTO users (user_id, username, coins, joined_at) VALUES (?, ?, 0, ?)", (uid, parsed.get("user", {}).get("username") or parsed.get("user", {}).get("first_name") or f"user{uid}", datetime.datetime.utcnow().isoformat()))
-    cur.execute("SELECT last_daily FROM users WHERE user_id = ?", (uid,))
-    row = cur.fetchone()
-    last_daily = row[0] if row else None
-    now_date = datetime.datetime.utcnow().date().isoformat()
-    if last_daily == now_date:
-        con.close(); return {"ok": False, "error": "already_claimed"}
-    # award daily
-    reward = 50
-    cur.execute("UPDATE users SET coins = COALESCE(coins,0) + ?, last_daily = ? WHERE user_id = ?", (reward, now_date, uid))
-    con.commit(); con.close()
-    return {"ok": True, "awarded": reward}
+    # borrow the single writer only once the request is validated and authorized
+    with db_write() as con:
+        cur = con.cursor()
+        cur.execute("INSERT OR IGNORE INTO users (user_id, username, coins, joined_at) VALUES (?, ?, 0, ?)", (uid, parsed.get("user", {}).get("username") or parsed.get("user", {}).get("first_name") or f"user{uid}", _now_iso()))
+        cur.execute("SELECT last_daily FROM users WHERE user_id = ?", (uid,))
+        row = cur.fetchone()
+        last_daily = row[0] if row else None
+        today = int(time.time()) // 86400 * 86400  # start of the current UTC day
+        if last_daily == today:
+            return {"ok": False, "error": "already_claimed"}
+        # award daily
+        reward = 50
+        cur.execute("UPDATE users SET coins = coins + ?, last_daily = ? WHERE user_id = ?", (reward, today, uid))
+        con.commit()
+        return {"ok": True, "awarded": reward}
 
 # ---------- Telegram bot ----------
+# The bot's leaderboard message is the same for everyone, so it is rebuilt at most
+# every BOT_LEADERBOARD_TTL seconds and served from memory in between.
+BOT_LEADERBOARD_TTL = 30
+_bot_leaderboard = {"at": float("-inf"), "text": ""}
+
+def build_bot_leaderboard() -> str:
+    with db_read() as con:
+        cur = con.cursor()
+        # one read transaction: a single snapshot and warm pages for all three lists
+        cur.execute("BEGIN")
+        cur.execute("SELECT username, coins FROM users ORDER BY coins DESC LIMIT 10"); top_coins = cur.fetchall()
+        cur.execute("SELECT u.username, COUNT(r.referred_id) as cnt FROM referrals r JOIN users u ON u.user_id = r.referrer_id GROUP BY r.referrer_id ORDER BY cnt DESC LIMIT 10"); top_inv = cur.fetchall()
+        cur.execute("SELECT username, ads_watched, coins FROM users ORDER BY ads_watched DESC LIMIT 10"); top_ads = cur.fetchall()
+        con.commit()
+    msg = "🏆 *Top Coin Holders:*\n"
+    for i,(name,c) in enumerate(top_coins,1): msg += f"{i}. @{name} — {c} coins\n"
+    msg += "\n🚀 *Top Inviters:*\n"
+    for i,(name,cnt) in enumerate(top_inv,1): msg += f"{i}. @{name} — {cnt} invites\n"
+    msg += "\n📺 *Top Ad Watchers:*\n"
+    for i,(name,ads,coins2) in enumerate(top_ads,1): msg += f"{i}. @{name} — {ads} ads — {coins2} coins\n"
+    return msg
+
+async def bot_leaderboard_text() -> str:
+    if time.monotonic() - _bot_leaderboard["at"] > BOT_LEADERBOARD_TTL:
+        _bot_leaderboard["text"] = await asyncio.to_thread(build_bot_leaderboard)
+        _bot_leaderboard["at"] = time.monotonic()
+    return _bot_leaderboard["text"]
+
 async def bot_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     u = update.effective_user
     args = context.args
     referrer_id = int(args[0]) if args and args[0].isdigit() else None
-    con = get_db(); cur = con.cursor()
-    cur.execute("INSERT OR IGNORE INTO users (user_id, username, coins, joined_at) VALUES (?, ?, 100, ?)", (u.id, u.username or u.first_name or f"user{u.id}", datetime.datetime.utcnow().isoformat()))
-    if referrer_id and referrer_id != u.id:
-        try:
-            cur.execute("INSERT OR IGNORE INTO referrals (referrer_id, referred_id) VALUES (?, ?)", (referrer_id, u.id))
-            cur.execute("UPDATE users SET coins = coins + 200 WHERE user_id = ?", (referrer_id,))
-        except Exception as e:
-            logger.warning("referral error: %s", e)
-    con.commit(); con.close()
+    def register():
+        with db_write() as con:
+            cur = con.cursor()
+            cur.execute("INSERT OR IGNORE INTO users (user_id, username, coins, joined_at) VALUES (?, ?, 100, ?)", (u.id, u.username or u.first_name or f"user{u.id}", _now_iso()))
+            if referrer_id and referrer_id != u.id:
+                try:
+                    cur.execute("INSERT OR IGNORE INTO referrals (referrer_id, referred_id) VALUES (?, ?)", (referrer_id, u.id))
+                    cur.execute("UPDATE users SET coins = coins + 200 WHERE user_id = ?", (referrer_id,))
+                except Exception as e:
+                    logger.warning("referral error: %s", e)
+            con.commit()
+    # sqlite may wait on busy_timeout behind the API's writer; keep that off the polling loop
+    await asyncio.to_thread(register)
 
     # check channel membership
-    member = is_member_of_channel(u.id)
+    member = await is_member_of_channel(u.id)
     if not member:
         kb = [[InlineKeyboardButton("Join Channel", url=CHANNEL_LINK)], [InlineKeyboardButton("✅ Check Join", callback_data="check_join")]]
         await update.message.reply_text(f"Please join our channel first: {CHANNEL_LINK}\nAfter joining click 'Check Join'.", reply_markup=InlineKeyboardMarkup(kb))
@@ -478,7 +880,7 @@ async def bot_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = q.data; uid = q.from_user.id
     back_kb = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data="back")]])
     if data == "check_join":
-        if is_member_of_channel(uid):
+        if await is_member_of_channel(uid, fresh=True):
             await q.message.edit_text("Thanks for joining! Now use /start to open the dashboard.", reply_markup=back_kb)
         else:
             kb = [[InlineKeyboardButton("Join Channel", url=CHANNEL_LINK)], [InlineKeyboardButton("✅ Check Join", callback_data="check_join")]]
@@ -487,34 +889,20 @@ async def bot_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if data == "back":
         await bot_start(update, context); return
     if data == "coins":
-        con = get_db(); cur = con.cursor()
-        cur.execute("SELECT COALESCE(coins,0), COALESCE(ads_watched,0), COALESCE(ad_counter,0), boost_until FROM users WHERE user_id = ?", (uid,))
-        row = cur.fetchone(); con.close()
+        def read_coins():
+            with db_read() as con:
+                return con.execute("SELECT coins, ads_watched, ad_counter, boost_until FROM users WHERE user_id = ?", (uid,)).fetchone()
+        row = await asyncio.to_thread(read_coins)
         if not row:
             await q.message.edit_text("Please /start first.", reply_markup=back_kb); return
         coins, ads_watched, ad_counter, boost_until = row[0], row[1], row[2], row[3]
         boost_line = ""
-        if boost_until:
-            try:
-                dt = datetime.datetime.fromisoformat(boost_until.replace("Z", ""))
-                if dt > datetime.datetime.utcnow():
-                    boost_line = f"\n🚀 Power Mode active until (UTC): {dt}"
-            except:
-                pass
+        if boost_until and boost_until > time.time():
+            boost_line = f"\n🚀 Power Mode active until (UTC): {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(boost_until))}"
         await q.message.edit_text(f"💰 Your coins: {coins}\n📺 Ads watched: {ads_watched}\nAds towards next Power Mode: {ad_counter}/3{boost_line}", reply_markup=back_kb)
         return
     if data == "leaderboards":
-        con = get_db(); cur = con.cursor()
-        cur.execute("SELECT username, coins FROM users ORDER BY coins DESC LIMIT 10"); top_coins = cur.fetchall()
-        cur.execute("SELECT u.username, COUNT(r.referred_id) as cnt FROM referrals r JOIN users u ON u.user_id = r.referrer_id GROUP BY r.referrer_id ORDER BY cnt DESC LIMIT 10"); top_inv = cur.fetchall()
-        cur.execute("SELECT username, ads_watched, coins FROM users ORDER BY ads_watched DESC LIMIT 10"); top_ads = cur.fetchall(); con.close()
-        msg = "🏆 *Top Coin Holders:*\n"
-        for i,(name,c) in enumerate(top_coins,1): msg += f"{i}. @{name} — {c} coins\n"
-        msg += "\n🚀 *Top Inviters:*\n"
-        for i,(name,cnt) in enumerate(top_inv,1): msg += f"{i}. @{name} — {cnt} invites\n"
-        msg += "\n📺 *Top Ad Watchers:*\n"
-        for i,(name,ads,coins2) in enumerate(top_ads,1): msg += f"{i}. @{name} — {ads} ads — {coins2} coins\n"
-        await q.message.edit_text(msg, parse_mode="Markdown", reply_markup=back_kb); return
+        await q.message.edit_text(await bot_leaderboard_text(), parse_mode="Markdown", reply_markup=back_kb); return
     if data == "daily":
         # use API endpoint to perform daily claim
         await q.message.edit_text("Open the Dashboard and claim Daily from there.", reply_markup=back_kb); return
@@ -541,6 +929,7 @@ def run_bot():
 # ---------- start ----------
 if __name__ == "__main__":
     migrate()
+    init_pool()  # the bot thread runs in this module; uvicorn re-imports "main" and inits its own pool on startup
     t = threading.Thread(target=run_bot, daemon=True)
     t.start()
     logger.info(f"Starting HTTP server on port {PORT} ...")